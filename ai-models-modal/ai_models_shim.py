@@ -1,6 +1,7 @@
 """Shim for interfacing with ai-models package and related plugins."""
 
 import dataclasses
+import functools
 from importlib.metadata import EntryPoint
 from typing import Type
 
@@ -72,6 +73,11 @@ SUPPORTED_AI_MODELS = [
 ]
 
 
+@functools.cache
 def get_model_class(model_name: str) -> AIModelType:
-    """Get the class initializer for an ai-models plugin."""
+    """Get the class initializer for an ai-models plugin.
+
+    Loading the entry point imports the plugin (and its heavy ML dependencies), so
+    we cache the result for the lifetime of the process.
+    """
     return AI_MODELS_CONFIGS[model_name].entry_point.load()
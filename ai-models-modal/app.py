@@ -83,6 +83,7 @@ inference_image = (
             "ai-models",
             "google-cloud-storage",
             "onnx==1.15.0",
+            "onnxconverter-common",
             "ujson",
         ]
     )
@@ -1,4 +1,5 @@
 import datetime
+import functools
 import logging
 import os
 import pathlib
@@ -22,6 +23,20 @@ AI_MODEL_ASSETS_DIR = CACHE_DIR / "assets"
 # for now, this is just the processed GFS/GDAS initial conditions that we produce.
 INIT_CONDITIONS_DIR = CACHE_DIR / "initial_conditions"
 
+# Set up paths to cache ONNX Runtime artifacts (e.g. pre-optimized model graphs)
+# so that we don't have to re-generate them every time a container starts.
+ORT_CACHE_DIR = CACHE_DIR / "onnxruntime"
+
+# Opt in to running ONNX models through TensorRT (with FP16 kernels), when it's
+# available in our image. The first run of each model pays a multi-minute engine
+# build, but the engines are cached under ORT_CACHE_DIR for later runs.
+USE_TENSORRT = False
+
+# Opt in to converting ONNX model weights to FP16 before running them. This halves
+# the memory (and bandwidth) needed for weights and activations, at some cost in
+# precision; model inputs and outputs are kept in FP32.
+USE_FP16_WEIGHTS = False
+
 # Set a default GPU that's large enough to work with any of the published models
 # available to the ai-models package.
 DEFAULT_GPU_CONFIG = modal.gpu.A100(memory=40)
@@ -63,10 +78,15 @@ def make_gfs_template_path(model_name: str) -> pathlib.Path:
     return AI_MODEL_ASSETS_DIR / f"{model_name}.input-template.grib2"
 
 
+@functools.cache
 def get_logger(
     name: str, level: int = logging.INFO, add_handler=False
 ) -> logging.Logger:
-    """Set up a default logger with configs for working within a modal app."""
+    """Set up a default logger with configs for working within a modal app.
+
+    Results are cached, so repeated calls for the same logger don't re-run setup
+    (or attach duplicate handlers).
+    """
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
@@ -82,6 +102,9 @@ def get_logger(
 
 
 def set_logger_basic_config(level: int = logging.INFO):
+    # Nothing to do if the root logger has already been configured.
+    if logging.getLogger().handlers:
+        return
     handler = logging.StreamHandler()
     handler.setFormatter(
         logging.Formatter("%(levelname)s: %(asctime)s: %(name)s  %(message)s")
@@ -8,17 +8,43 @@ Rothenberg, Daniel: "Enabling Scalable, Serverless Weather Model Analyses by
 for more details.
 """
 
+import functools
 import os
 from pathlib import Path
 from typing import Any
 
+import requests
 import ujson
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
 
 from . import config
 
 logger = config.get_logger(__name__)
 
+# Blobs larger than this are downloaded as concurrent ranged GETs rather than in a
+# single stream; a single stream tops out well below what the NIC can sustain.
+SLICED_DOWNLOAD_THRESHOLD = 64 * 1024 * 1024  # bytes
+SLICED_DOWNLOAD_CHUNK_SIZE = 32 * 1024 * 1024  # bytes
+SLICED_DOWNLOAD_MAX_WORKERS = 8
+# Max number of blobs that callers should download concurrently with one handler.
+MAX_CONCURRENT_DOWNLOADS = 4
+
+# Files larger than this are uploaded as concurrent chunks (a multipart upload which
+# GCS assembles server-side) rather than in a single stream.
+CHUNKED_UPLOAD_THRESHOLD = 64 * 1024 * 1024  # bytes
+CHUNKED_UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024  # bytes
+CHUNKED_UPLOAD_MAX_WORKERS = 8
+# (connect, read) timeouts, in seconds, for each upload request.
+UPLOAD_TIMEOUT = (10, 600)
+
+# All of the transfer manager's worker threads share their client's HTTP session, so
+# its connection pool must hold a connection for every worker that can be active at
+# once; otherwise, urllib3 discards connections and chunks pay for new handshakes.
+HTTP_POOL_MAXSIZE = max(
+    MAX_CONCURRENT_DOWNLOADS * SLICED_DOWNLOAD_MAX_WORKERS, CHUNKED_UPLOAD_MAX_WORKERS
+)
+
 
 def get_service_account_json(env_var: str = "GCS_SERVICE_ACCOUNT_INFO") -> dict:
     """Try to generate service account JSON from an env var.
@@ -28,7 +54,11 @@ def get_service_account_json(env_var: str = "GCS_SERVICE_ACCOUNT_INFO") -> dict:
     env_var: str
         Name of an environment variable containing stringified JSON service account credentials.
     """
-    service_account_info = os.environ.get(env_var, "")
+    return _parse_service_account_info(os.environ.get(env_var, ""))
+
+
+def _parse_service_account_info(service_account_info: str) -> dict:
+    """Parse stringified JSON service account credentials, if any were provided."""
     if not service_account_info:
         return {}
     return ujson.loads(service_account_info)
@@ -40,6 +70,12 @@ class GoogleCloudStorageHandler(object):
             self._client = storage.Client()
         else:
             self._client = client
+        # NOTE: The storage client doesn't expose its session publicly, and otherwise
+        # leaves it with requests' default pool of 10 connections.
+        self._client._http.mount(
+            "https://",
+            requests.adapters.HTTPAdapter(pool_maxsize=HTTP_POOL_MAXSIZE),
+        )
 
     @property
     def client(self):
@@ -81,18 +117,36 @@ class GoogleCloudStorageHandler(object):
 
         bucket = self.client.bucket(bucket_name)
 
-        # NOTE: `Bucket.blob` differs from `Bucket.get_blob` as it doesn't retrieve
-        # any content from Google Cloud Storage. As we don't need additional data,
-        # using `Bucket.blob` is preferred here.
-        blob = bucket.blob(source_blob_name)
+        # NOTE: We use `Bucket.get_blob` here instead of `Bucket.blob` so that we know
+        # the size of the blob up front, which determines how we download it.
+        blob = bucket.get_blob(source_blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"gs://{bucket_name}/{source_blob_name} not found")
         logger.info(
             f"Downloading gs://{bucket_name}/{source_blob_name} to {destination_pth}"
         )
-        blob.download_to_filename(destination_pth)
+        if blob.size is not None and blob.size > SLICED_DOWNLOAD_THRESHOLD:
+            # NOTE: We use threads rather than the default process pool; this is
+            # network-bound work, and it lets callers safely invoke this method from
+            # their own thread pools.
+            transfer_manager.download_chunks_concurrently(
+                blob,
+                str(destination_pth),
+                chunk_size=SLICED_DOWNLOAD_CHUNK_SIZE,
+                max_workers=SLICED_DOWNLOAD_MAX_WORKERS,
+                worker_type=transfer_manager.THREAD,
+            )
+        else:
+            blob.download_to_filename(destination_pth)
 
     def upload_blob(
-        self, bucket_name: str, source_file_pth: Path, destination_blob_name: str
-    ):
+        self,
+        bucket_name: str,
+        source_file_pth: Path,
+        destination_blob_name: str,
+        content_type: str | None = None,
+        chunk_size_mb: int = 16,
+    ) -> storage.Blob:
         """Uploads a blob to GCS from a local path.
 
         Parameters
@@ -103,6 +157,19 @@ class GoogleCloudStorageHandler(object):
             Local path to the file to upload.
         destination_blob_name : str
             Blob name to use when writing to `bucket_name` on GCS.
+        content_type : str, optional
+            Content type to set on the blob; if not provided, it will be guessed
+            from the file name.
+        chunk_size_mb : int
+            Size of each request (in MiB) when uploading a file in a single stream;
+            must be a multiple of 0.25 MiB. Larger chunks mean fewer round-trips
+            for large files.
+
+        Returns
+        -------
+        storage.Blob
+            The uploaded blob, with its metadata (e.g. `generation`, `size`) populated
+            from GCS.
         """
 
         bucket = self.client.bucket(bucket_name)
@@ -110,7 +177,73 @@ class GoogleCloudStorageHandler(object):
         logger.info(
             f"Uploading {source_file_pth} to gs://{bucket_name}/{destination_blob_name}."
         )
-        blob.upload_from_filename(source_file_pth)
+        if os.path.getsize(source_file_pth) > CHUNKED_UPLOAD_THRESHOLD:
+            return self.upload_blob_parallel(
+                bucket_name,
+                source_file_pth,
+                destination_blob_name,
+                content_type=content_type,
+            )
+        # NOTE: The upload response populates the blob's metadata for us.
+        blob.chunk_size = chunk_size_mb * 1024 * 1024
+        blob.upload_from_filename(
+            source_file_pth, content_type=content_type, timeout=UPLOAD_TIMEOUT
+        )
+        return blob
+
+    def upload_blob_parallel(
+        self,
+        bucket_name: str,
+        source_file_pth: Path,
+        destination_blob_name: str,
+        max_workers: int = CHUNKED_UPLOAD_MAX_WORKERS,
+        content_type: str | None = None,
+    ) -> storage.Blob:
+        """Uploads a blob to GCS from a local path, as several concurrent chunks.
+
+        The chunks are uploaded as parts of a multipart upload, which GCS then
+        assembles into the final blob server-side. This is much faster than a single
+        stream for large files.
+
+        Parameters
+        ----------
+        bucket_name : str
+            Bucket on GCS where the blob should be uploaded.
+        source_file_pth : Path
+            Local path to the file to upload.
+        destination_blob_name : str
+            Blob name to use when writing to `bucket_name` on GCS.
+        max_workers : int
+            Maximum number of chunks to upload concurrently; the number of chunks
+            itself is set by the file size and `CHUNKED_UPLOAD_CHUNK_SIZE`.
+        content_type : str, optional
+            Content type to set on the blob.
+
+        Returns
+        -------
+        storage.Blob
+            The uploaded blob, with its metadata (e.g. `generation`, `size`) populated
+            from GCS.
+        """
+
+        bucket = self.client.bucket(bucket_name)
+        blob = bucket.blob(destination_blob_name)
+        logger.info(
+            f"Uploading {source_file_pth} to gs://{bucket_name}/{destination_blob_name}"
+            f" in parallel ({max_workers} workers)."
+        )
+        transfer_manager.upload_chunks_concurrently(
+            str(source_file_pth),
+            blob,
+            chunk_size=CHUNKED_UPLOAD_CHUNK_SIZE,
+            max_workers=max_workers,
+            worker_type=transfer_manager.THREAD,
+            content_type=content_type,
+        )
+        # The multipart upload doesn't hand back the final object's metadata, so we
+        # have to fetch it explicitly.
+        blob.reload()
+        return blob
 
     def upload_json_to_blob(
         self, bucket_name: str, json_str: str, destination_blob_name: str
@@ -131,3 +264,29 @@ class GoogleCloudStorageHandler(object):
         blob = bucket.blob(destination_blob_name)
         logger.info(f"Uploading JSON to gs://{bucket_name}/{destination_blob_name}.")
         blob.upload_from_string(data=json_str, content_type="application/json")
+
+
+@functools.lru_cache(maxsize=4)
+def _get_handler(service_account_info: str) -> GoogleCloudStorageHandler:
+    """Build a handler for stringified JSON service account credentials."""
+    return GoogleCloudStorageHandler.with_service_account_info(
+        _parse_service_account_info(service_account_info)
+    )
+
+
+def get_handler_from_env(
+    env_var: str = "GCS_SERVICE_ACCOUNT_INFO",
+) -> GoogleCloudStorageHandler:
+    """Get a shared handler authenticated with the service account info in an env var.
+
+    Building a client sets up credentials and an HTTP session, so we cache handlers
+    keyed on the raw credentials string. This lets warm containers re-use the same
+    authenticated client across invocations, while still picking up new credentials
+    if they ever change.
+
+    Parameters:
+    -----------
+    env_var: str
+        Name of an environment variable containing stringified JSON service account credentials.
+    """
+    return _get_handler(os.environ.get(env_var, ""))
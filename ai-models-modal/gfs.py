@@ -1,14 +1,14 @@
 """Utilities for acquiring, fetching, and working with GFS/GDAS data for
 use in the AI models application."""
 
+import ctypes
 import datetime
+import os
 import pathlib
 from collections import namedtuple
-from typing import Any, Sequence, Type
+from typing import Any, Iterable, Iterator, Sequence, Type
 
 import pygrib
-from tqdm import tqdm
-from tqdm.contrib.logging import logging_redirect_tqdm
 
 from . import config
 
@@ -88,6 +88,12 @@ PyGribMessage = Type[pygrib._pygrib.gribmessage]
 
 GFS_BUCKET = "global-forecast-system"
 
+# Max number of buffers we can hand to a single writev(2) call (IOV_MAX on Linux).
+IOV_MAX = 1024
+# Number of bytes of serialized GRIB messages to accumulate before writing them out;
+# large writes amortize the per-call overhead on high-latency network filesystems.
+GRIB_WRITE_BUFFER_SIZE = 16 * 1024 * 1024  # bytes
+
 
 def make_gfs_ics_blob_name(model_epoch: datetime.datetime) -> str:
     """Generate the blob name for a GFS initial conditions file.
@@ -152,8 +158,11 @@ def select_grb_from_list(grbs: Sequence[PyGribMessage], **matchers) -> PyGribMes
 def grb_matches(grb: PyGribMessage, **matchers) -> PyGribMessage:
     """
     Return "true" if a GRIB message matches all the specified key-value attributes.
+
+    As with `pygrib.open.select`, a matcher value may also be a function which is
+    called with the message's value for that key and returns a bool.
     """
-    return all(grb[k] == v for k, v in matchers.items())
+    return all(v(grb[k]) if callable(v) else grb[k] == v for k, v in matchers.items())
 
 
 def process_gdas_grib(
@@ -161,7 +170,7 @@ def process_gdas_grib(
     gdas_pth: pathlib.Path,
     model_init: datetime.datetime = config.DEFAULT_GFS_TEMPLATE_MODEL_EPOCH,
     extra_template_matchers: dict = {},
-) -> Sequence[PyGribMessage]:
+) -> Iterator[PyGribMessage]:
     """Process a GDAS GRIB file to prepare an input for an AI NWP forecast.
 
     Parameters
@@ -180,87 +189,228 @@ def process_gdas_grib(
 
     Returns
     -------
-    Sequence[GrbMessage]
-        A sequence of GRIB messages which can be written to a binary output file.
+    Iterator[GrbMessage]
+        A stream of GRIB messages which can be written to a binary output file. The
+        messages are read from the template and processed lazily, as the stream is
+        consumed.
     """
+    return process_gdas_grib_sets(
+        template_pth, gdas_pth, [(model_init, extra_template_matchers)]
+    )[0]
+
+
+def process_gdas_grib_sets(
+    template_pth: pathlib.Path,
+    gdas_pth: pathlib.Path,
+    template_sets: Sequence[tuple[datetime.datetime, dict]],
+) -> list[Iterator[PyGribMessage]]:
+    """Process several template subsets against the same GDAS GRIB file.
+
+    This is equivalent to calling `process_gdas_grib` once per entry in
+    `template_sets`, but only scans the (large) GDAS GRIB file once.
+
+    Parameters
+    ----------
+    template_pth : pathlib.Path
+        The local path to the ERA-5 template GRIB file for a given model.
+    gdas_pth : pathlib.Path
+        The local path to the GDAS GRIB file, most likely downloaded from GCS.
+    template_sets : Sequence[tuple[datetime.datetime, dict]]
+        Pairs of (model_init, extra_template_matchers), with the same meaning as in
+        `process_gdas_grib`.
+
+    Returns
+    -------
+    list[Iterator[GrbMessage]]
+        One stream of GRIB messages for each entry in `template_sets`, in order.
+    """
+    # Make a quick first pass through the template to figure out which fields we'll
+    # need from the source file; we don't hold on to any of the messages here.
     logger.info("Reading template GRIB file %s...", template_pth)
-    template_grbs = []
+    all_short_names = set()
+    n_template_grbs = [0 for _ in template_sets]
     with pygrib.open(str(template_pth)) as grbs:
-        if extra_template_matchers:
-            grbs = grbs.select(**extra_template_matchers)
         for grb in grbs:
-            template_grbs.append(grb)
-    logger.info("... found %d GRIB messages", len(template_grbs))
-
-    time_kwargs = dict(
-        dataDate=int(model_init.strftime("%Y%m%d")),
-        dataTime=int(model_init.strftime("%H%M")),
-    )
-
-    logger.info("Copying and processing GRIB messages from %s...", gdas_pth)
-    with pygrib.open(str(gdas_pth)) as source_grbs, logging_redirect_tqdm(
-        loggers=[
-            logger,
-        ]
-    ):
+            for i, (_, extra_template_matchers) in enumerate(template_sets):
+                if grb_matches(grb, **extra_template_matchers):
+                    all_short_names.add(grb.shortName)
+                    n_template_grbs[i] += 1
+    for n in n_template_grbs:
+        logger.info("... found %d GRIB messages", n)
+
+    logger.info("Subsetting GRIB messages from %s...", gdas_pth)
+    with pygrib.open(str(gdas_pth)) as source_grbs:
         # Pre-emptively subset all the source_grbs by matching against short names in
         # the template collection we previously opened. This greatly reduces the time it
         # takes to seek through the source GRIB file, which involves repeatedly reading
         # through the entire file from start to finish (~30x improvement when reading from
         # an SSD, so much faster on a cloud VM).
-        all_short_names = [grb.shortName for grb in template_grbs]
         for mappers in mappers_by_type_of_level.values():
-            all_short_names.extend(m.source_field for m in mappers.values())
-        all_short_names = set(all_short_names)
+            all_short_names.update(m.source_field for m in mappers.values())
         source_grb_list = source_grbs.select(shortName=all_short_names)
 
-        for grb in tqdm(
-            template_grbs,
-            unit="msg",
-            total=len(template_grbs),
-            desc="GRIB messages",
-        ):
-            # Get the type of level so that we can match to the right mapper set.
-            mappers = mappers_by_type_of_level[grb.typeOfLevel]
-            if grb.shortName in mappers:
-                mapper = mappers[grb.shortName]
-                source_matchers = mapper.source_matcher_override
-                source_grb = select_grb_from_list(
-                    source_grb_list,
-                    shortName=mapper.source_field,
-                    typeOfLevel=source_matchers.get("typeOfLevel", grb.typeOfLevel),
-                    level=source_matchers.get("level", grb.level),
-                )
-                old_mean = grb.values.mean()
-                grb.values = mapper.fn(source_grb.values)
-                new_mean = grb.values.mean()
-                grb.shortName = mapper.target_field
-                logger.debug(
-                    "mapped: [x] | %10s | Old: %g | New: %g | Copied: %g",
-                    grb.shortName,
-                    old_mean,
-                    mapper.fn(source_grb.values).mean(),
-                    new_mean,
-                )
-            else:
-                source_grb = select_grb_from_list(
-                    source_grb_list,
-                    shortName=grb.shortName,
-                    typeOfLevel=grb.typeOfLevel,
-                    level=grb.level,
-                )
-                old_mean = grb.values.mean()
-                grb.values = source_grb.values
-                new_mean = grb.values.mean()
-                logger.debug(
-                    "mapped: [ ] | %10s | Old: %g | Copied: %g",
-                    grb.shortName,
-                    old_mean,
-                    new_mean,
-                )
+    return [
+        _iter_mapped_template_grbs(
+            template_pth, extra_template_matchers, source_grb_list, model_init
+        )
+        for model_init, extra_template_matchers in template_sets
+    ]
+
+
+def _iter_mapped_template_grbs(
+    template_pth: pathlib.Path,
+    extra_template_matchers: dict,
+    source_grb_list: Sequence[PyGribMessage],
+    model_init: datetime.datetime,
+) -> Iterator[PyGribMessage]:
+    """Stream template GRIB messages, overwritten with data from matching source ones."""
+    time_kwargs = dict(
+        dataDate=int(model_init.strftime("%Y%m%d")),
+        dataTime=int(model_init.strftime("%H%M")),
+    )
+
+    with pygrib.open(str(template_pth)) as grbs:
+        for grb in grbs:
+            if not grb_matches(grb, **extra_template_matchers):
+                continue
+            _map_template_grb(grb, source_grb_list)
 
             # Overwrite the GRIB metadata with the model initialization time.
             for key, val in time_kwargs.items():
                 grb[key] = val
+            yield grb
+
+
+def _map_template_grb(
+    grb: PyGribMessage, source_grb_list: Sequence[PyGribMessage]
+) -> None:
+    """Overwrite a template GRIB message in-place with data from a matching source one."""
+    # Get the type of level so that we can match to the right mapper set.
+    mappers = mappers_by_type_of_level[grb.typeOfLevel]
+    if grb.shortName in mappers:
+        mapper = mappers[grb.shortName]
+        source_matchers = mapper.source_matcher_override
+        source_grb = select_grb_from_list(
+            source_grb_list,
+            shortName=mapper.source_field,
+            typeOfLevel=source_matchers.get("typeOfLevel", grb.typeOfLevel),
+            level=source_matchers.get("level", grb.level),
+        )
+        old_mean = grb.values.mean()
+        grb.values = mapper.fn(source_grb.values)
+        new_mean = grb.values.mean()
+        grb.shortName = mapper.target_field
+        logger.debug(
+            "mapped: [x] | %10s | Old: %g | New: %g | Copied: %g",
+            grb.shortName,
+            old_mean,
+            mapper.fn(source_grb.values).mean(),
+            new_mean,
+        )
+    else:
+        source_grb = select_grb_from_list(
+            source_grb_list,
+            shortName=grb.shortName,
+            typeOfLevel=grb.typeOfLevel,
+            level=grb.level,
+        )
+        old_mean = grb.values.mean()
+        grb.values = source_grb.values
+        new_mean = grb.values.mean()
+        logger.debug(
+            "mapped: [ ] | %10s | Old: %g | Copied: %g",
+            grb.shortName,
+            old_mean,
+            new_mean,
+        )
+
+
+def _writev_all(fd: int, buffers: Sequence[bytes]) -> int:
+    """Write all of `buffers` to `fd`, retrying if writev(2) writes only partially."""
+    total = sum(len(buf) for buf in buffers)
+    written = os.writev(fd, buffers)
+    if written < total:
+        # Rare for regular files, but the contract of writev(2) permits it; fall
+        # back to writing the remaining bytes out directly.
+        remaining = memoryview(b"".join(buffers))[written:]
+        while remaining:
+            n = os.write(fd, remaining)
+            remaining = remaining[n:]
+    return total
+
+
+def _preallocate(fd: int, size: int) -> None:
+    """Reserve `size` bytes on disk for `fd`, if the filesystem supports it.
+
+    NOTE: We call fallocate(2) directly instead of using `os.posix_fallocate`, because
+    glibc emulates the latter by writing to every block of the file when the
+    filesystem doesn't support it - which is far worse than not preallocating at
+    all on a network filesystem.
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    fallocate = libc.fallocate
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    if fallocate(fd, 0, 0, size) != 0:
+        logger.debug(
+            "Could not preallocate output file: %s", os.strerror(ctypes.get_errno())
+        )
+
+
+def write_grib_messages(
+    grbs: Iterable[PyGribMessage],
+    output_pth: pathlib.Path,
+    size_hint: int | None = None,
+) -> int:
+    """Write a sequence of GRIB messages to a binary output file.
 
-    return template_grbs
+    Messages are written in batches of up to `GRIB_WRITE_BUFFER_SIZE` bytes with a
+    single writev(2) call per batch, rather than one write(2) per message.
+
+    Parameters
+    ----------
+    grbs : Iterable[PyGribMessage]
+        The GRIB messages to write, in order.
+    output_pth : pathlib.Path
+        The path of the output file; it will be truncated if it already exists.
+    size_hint : int, optional
+        The expected size of the output file in bytes; if provided, we preallocate
+        this much space up front so the filesystem can lay out the file in contiguous
+        extents. It doesn't need to be exact.
+
+    Returns
+    -------
+    int
+        The number of bytes written.
+    """
+    n_bytes = 0
+    fd = os.open(output_pth, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if size_hint:
+            _preallocate(fd, size_hint)
+        batch, batch_size = [], 0
+        for grb in grbs:
+            # NOTE: Ideally we'd hand the underlying eccodes handle straight to
+            # `eccodes.codes_write` and skip this copy into a Python bytes object, but
+            # pygrib only exposes its grib_handle at the C level, so `tostring()` is
+            # the only way to serialize a message from Python.
+            msg = grb.tostring()
+            batch.append(msg)
+            batch_size += len(msg)
+            if len(batch) >= IOV_MAX or batch_size >= GRIB_WRITE_BUFFER_SIZE:
+                n_bytes += _writev_all(fd, batch)
+                batch, batch_size = [], 0
+        if batch:
+            n_bytes += _writev_all(fd, batch)
+        # Trim any excess space that we may have preallocated.
+        if size_hint:
+            os.ftruncate(fd, n_bytes)
+        # We won't read this file again in this process, so release its pages from
+        # the page cache rather than letting them crowd out more useful data. Only
+        # clean pages can be dropped, so flush first; on a network filesystem this
+        # work would otherwise just happen on close.
+        if hasattr(os, "posix_fadvise"):
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+    return n_bytes
@@ -1,9 +1,12 @@
 """A Modal application for running `ai-models` weather forecasts."""
 
 import datetime
+import itertools
 import os
 import pathlib
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Sequence
 
 import modal
 from ai_models import model
@@ -16,6 +19,16 @@ from .app import stub, volume
 config.set_logger_basic_config()
 logger = config.get_logger(__name__, add_handler=False)
 
+# Cap on concurrent model asset (weights) downloads.
+MAX_ASSET_DOWNLOAD_WORKERS = 8
+# Max number of files / blobs to enumerate when checking the application environment.
+MAX_CHECK_LISTING = 50
+# Number of those files / blobs to include in summaries logged at INFO level; the full
+# listings are only logged at DEBUG level.
+CHECK_LISTING_SAMPLE = 5
+# Directories we've already created in this process.
+_CREATED_DIRS: set[pathlib.Path] = set()
+
 
 @stub.function(
     image=stub.image,
@@ -65,10 +78,7 @@ def prepare_gfs_analysis(
         )
         return
 
-    service_account_info = gcs.get_service_account_json("GCS_SERVICE_ACCOUNT_INFO")
-    gcs_handler = gcs.GoogleCloudStorageHandler.with_service_account_info(
-        service_account_info
-    )
+    gcs_handler = gcs.get_handler_from_env("GCS_SERVICE_ACCOUNT_INFO")
 
     # Set up the files to download with useful metadata (e.g. time lags)
     match model_name:
@@ -93,14 +103,25 @@ def prepare_gfs_analysis(
             raise ValueError(f"Encountered unknown model {model_name}")
 
     source_fns = [blob_name.split("/")[-1] for blob_name in source_blob_names]
-    for source_blob_name, source_fn in zip(source_blob_names, source_fns):
+    for source_blob_name in source_blob_names:
         logger.info(
             f"Attempting to download GFS/GDAS blob gs://{gfs.GFS_BUCKET}/{source_blob_name}..."
         )
-        gcs_handler.download_blob(gfs.GFS_BUCKET, source_blob_name, source_fn)
+    # Each download is an independent, latency-bound GET against GCS, so we fan them
+    # out over a small thread pool to overlap the round-trips.
+    with ThreadPoolExecutor(
+        max_workers=min(len(source_blob_names), gcs.MAX_CONCURRENT_DOWNLOADS)
+    ) as executor:
+        list(
+            executor.map(
+                lambda p: gcs_handler.download_blob(gfs.GFS_BUCKET, p[0], p[1]),
+                zip(source_blob_names, source_fns),
+            )
+        )
 
-        # Sanity check to make sure we were able to download the GDAS file.
-        if not pathlib.Path(source_fn).exists():
+    # Sanity check to make sure we were able to download the GDAS files.
+    for source_fn in source_fns:
+        if not os.path.exists(source_fn):
             raise RuntimeError("Failed to download GFS/GDAS blob.")
 
     # Run subsetting
@@ -126,66 +147,77 @@ def prepare_gfs_analysis(
                 datetime.timedelta(hours=-6),
                 datetime.timedelta(hours=-18),
             ]
-            subset_grbs = []
-            # Set 1 - Core fields (everything but precipitation)
-            for source_fn, template_td in zip(source_fns, template_tds):
-                logger.info("Processing Set 1 (core fields) -> %s", source_fn)
+            # NOTE: The message streams are lazy, so nothing is read or processed until
+            # we write them out below.
+            set_1_grbs, set_2_grbs = [], []
+            # Set 1 - Core fields (everything but precipitation) and Set 2 -
+            # Precipitation, using the alternate time deltas and hardcoding the
+            # precipitation field. Both sets are drawn from the same source file, so we
+            # process them together to only scan each source file once.
+            for source_fn, template_td, tp_template_td in zip(
+                source_fns, template_tds, tp_template_tds
+            ):
+                logger.info(
+                    "Processing Set 1 (core fields) and Set 2 (precipitation) -> %s",
+                    source_fn,
+                )
                 template_dt = config.DEFAULT_GFS_TEMPLATE_MODEL_EPOCH + template_td
+                tp_template_dt = config.DEFAULT_GFS_TEMPLATE_MODEL_EPOCH + tp_template_td
                 extra_template_matchers = {
                     "dataDate": int(template_dt.strftime("%Y%m%d")),
                     "dataTime": int(template_dt.strftime("%H%M")),
                     "shortName": lambda x: x != "tp",
                 }
-                output_msgs = gfs.process_gdas_grib(
-                    template_pth,
-                    pathlib.Path(source_fn),
-                    # Offset the model_init time by the expected timedelta so that we
-                    # appropriately encode the GRIB message timestamps.
-                    model_init + template_td,
-                    extra_template_matchers=extra_template_matchers,
-                )
-                subset_grbs.extend(output_msgs)
-            # Set 2) - Precipitation; use the alternate time deltas and hardcode the precipitation
-            # field.
-            for source_fn, template_td in zip(source_fns, tp_template_tds):
-                logger.info("Processing Set 2 (precipitation) -> %s", source_fn)
-                template_dt = config.DEFAULT_GFS_TEMPLATE_MODEL_EPOCH + template_td
-                extra_template_matchers = {
-                    "dataDate": int(template_dt.strftime("%Y%m%d")),
-                    "dataTime": int(template_dt.strftime("%H%M")),
+                tp_extra_template_matchers = {
+                    "dataDate": int(tp_template_dt.strftime("%Y%m%d")),
+                    "dataTime": int(tp_template_dt.strftime("%H%M")),
                     "shortName": "tp",
                 }
-                output_msgs = gfs.process_gdas_grib(
+                set_1_msgs, set_2_msgs = gfs.process_gdas_grib_sets(
                     template_pth,
                     pathlib.Path(source_fn),
-                    model_init + template_td,
-                    extra_template_matchers=extra_template_matchers,
+                    [
+                        # Offset the model_init time by the expected timedelta so that
+                        # we appropriately encode the GRIB message timestamps.
+                        (model_init + template_td, extra_template_matchers),
+                        (model_init + tp_template_td, tp_extra_template_matchers),
+                    ],
                 )
-                subset_grbs.extend(output_msgs)
+                set_1_grbs.append(set_1_msgs)
+                set_2_grbs.append(set_2_msgs)
+            # Preserve the original ordering of the output messages: all of Set 1,
+            # followed by all of Set 2.
+            subset_grbs = itertools.chain(*set_1_grbs, *set_2_grbs)
         case _:
             raise ValueError(f"Encountered unknown model {model_name}")
 
-    with (
-        open(proc_gdas_fn, "wb") as f,
-        logging_redirect_tqdm(
-            loggers=[
-                logger,
-            ]
-        ),
-    ):
-        for grb in tqdm(
-            subset_grbs,
-            unit="msg",
-            total=len(subset_grbs),
-            desc="GRIB messages",
-        ):
-            msg = grb.tostring()
-            f.write(msg)
+    # Write directly to the cache, under a temporary name so that readers never see a
+    # partially written file, and then atomically move it into place.
+    tmp_proc_gdas_pth = final_proc_gdas_pth.with_suffix(".grib.tmp")
     logger.info(
-        "Copying processed GFS/GDAS file to cache at %s...",
+        "Writing processed GFS/GDAS file to cache at %s...",
         final_proc_gdas_pth,
     )
-    shutil.copy(proc_gdas_fn, final_proc_gdas_pth)
+    # NOTE: The GRIB messages are processed lazily as we write them out, so we need to
+    # redirect logs from the gfs module, too.
+    with logging_redirect_tqdm(
+        loggers=[
+            logger,
+            gfs.logger,
+        ]
+    ):
+        gfs.write_grib_messages(
+            tqdm(
+                subset_grbs,
+                unit="msg",
+                desc="GRIB messages",
+            ),
+            tmp_proc_gdas_pth,
+            # The output re-uses the template's messages (and packing), so the
+            # template's size is a good estimate of the size of the output.
+            size_hint=template_pth.stat().st_size,
+        )
+    os.replace(tmp_proc_gdas_pth, final_proc_gdas_pth)
     logger.info("... done.")
 
     # Sanity check to make sure that we wrote out the processed GDAS file.
@@ -193,6 +225,17 @@ def prepare_gfs_analysis(
         raise RuntimeError("Failed to produce subset GFS/GDAS GRIB.")
 
 
+def _walk_files(root: pathlib.Path) -> Iterator[str]:
+    """Lazily yield the paths of all files under a directory.
+
+    Unlike `Path.glob("**/*")`, this relies on `os.scandir` (via `os.walk`) and
+    doesn't need to `stat()` every entry, which is slow on a network file system.
+    """
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            yield os.path.join(dirpath, filename)
+
+
 @stub.function(
     image=stub.image,
     secrets=[config.ENV_SECRETS],
@@ -211,12 +254,15 @@ def check_assets(skip_validate_env: bool = False):
 
     logger.info(f"Running locally -> {modal.is_local()}")
 
-    assets = list(config.AI_MODEL_ASSETS_DIR.glob("**/*"))
-    logger.info(f"Found {len(assets)} assets:")
-    for i, asset in enumerate(assets, 1):
-        logger.info(f"({i}) {asset}")
+    logger.info(f"Checking for assets in {config.AI_MODEL_ASSETS_DIR}...")
+    n_assets = 0
+    sample = []
+    for n_assets, asset in enumerate(_walk_files(config.AI_MODEL_ASSETS_DIR), 1):
+        if n_assets <= CHECK_LISTING_SAMPLE:
+            sample.append(asset)
+        logger.debug("(%d) %s", n_assets, asset)
+    logger.info(f"Found {n_assets} assets (sample: {sample}).")
     logger.info(f"CDS API URL: {os.environ['CDSAPI_URL']}")
-    logger.info(f"CDS API Key: {os.environ['CDSAPI_KEY']}")
 
     client = cdsapi.Client()
     logger.info(client)
@@ -240,21 +286,32 @@ def check_assets(skip_validate_env: bool = False):
     logger.info(f"onnxruntime device: {ort.get_device()}")  # output: GPU
 
     logger.info(f"Checking contents on network file system at {config.CACHE_DIR}...")
-    for i, asset in enumerate(config.CACHE_DIR.glob("**/*"), 1):
-        logger.info(f"({i}) {asset}")
+    files = list(itertools.islice(_walk_files(config.CACHE_DIR), MAX_CHECK_LISTING))
+    logger.info(
+        f"Found {len(files)} files (showing at most {MAX_CHECK_LISTING}; sample:"
+        f" {files[:CHECK_LISTING_SAMPLE]})."
+    )
+    for i, file in enumerate(files, 1):
+        logger.debug("(%d) %s", i, file)
 
     logger.info("Checking for access to GCS...")
 
-    service_account_info = gcs.get_service_account_json("GCS_SERVICE_ACCOUNT_INFO")
-    gcs_handler = gcs.GoogleCloudStorageHandler.with_service_account_info(
-        service_account_info
-    )
+    gcs_handler = gcs.get_handler_from_env("GCS_SERVICE_ACCOUNT_INFO")
     bucket_name = os.environ["GCS_BUCKET_NAME"]
+    # We only need to confirm that we can access the bucket, so there is no need to
+    # page through its entire contents.
     logger.info(f"Listing blobs in GCS bucket gs://{bucket_name}")
-    blobs = list(gcs_handler.client.list_blobs(bucket_name))
-    logger.info(f"Found {len(blobs)} blobs:")
+    blobs = list(
+        gcs_handler.client.list_blobs(
+            bucket_name, max_results=MAX_CHECK_LISTING, page_size=MAX_CHECK_LISTING
+        )
+    )
+    logger.info(
+        f"Found {len(blobs)} blobs (showing at most {MAX_CHECK_LISTING}; sample:"
+        f" {[blob.name for blob in blobs[:CHECK_LISTING_SAMPLE]]})."
+    )
     for i, blob in enumerate(blobs, 1):
-        logger.info(f"({i}) {blob.name}")
+        logger.debug("(%d) %s", i, blob.name)
 
 
 @stub.cls(
@@ -274,7 +331,8 @@ class AIModel:
         use_gfs: bool = False,
     ) -> None:
         self.model_name = model_name
-        self.model_init = model_init
+        self.use_gfs = use_gfs
+        self._set_model_init(model_init)
 
         # Cap forecast lead time to 10 days; the models may or may not work longer than
         # this, but this is an unnecessary foot-gun. A savvy user can disable this check
@@ -289,10 +347,17 @@ class AIModel:
         else:
             self.lead_time = lead_time
 
-        self.out_pth = config.make_output_path(model_name, model_init, use_gfs)
-        self.out_pth.parent.mkdir(parents=True, exist_ok=True)
-
-        self.use_gfs = use_gfs
+    def _set_model_init(self, model_init: datetime.datetime) -> None:
+        """Set the model initialization time, and the output path that depends on it."""
+        self.model_init = model_init
+        self.out_pth = config.make_output_path(
+            self.model_name, model_init, self.use_gfs
+        )
+        # Even a no-op mkdir costs a round-trip on the network file system, so we only
+        # do it once per directory.
+        if self.out_pth.parent not in _CREATED_DIRS:
+            self.out_pth.parent.mkdir(parents=True, exist_ok=True)
+            _CREATED_DIRS.add(self.out_pth.parent)
 
     @modal.enter()
     def _initialize_model(self):
@@ -304,12 +369,36 @@ class AIModel:
             f"   Initial conditions source: {'gfs' if self.use_gfs else 'era5'}"
         )
         logger.info("Running model initialization / staging...")
-        if self.use_gfs:
-            self.init_model = self._init_model_for_gfs()
-        else:
-            self.init_model = self._init_model_for_era5()
+        self.init_model = self._init_model()
+        self._warm_up_onnx_sessions()
         logger.info("... done! Model is initialized and ready to run.")
 
+    def _warm_up_onnx_sessions(self):
+        """Create and warm up sessions for any ONNX models the model will run."""
+        from . import ort_shim
+
+        onnx_files = [
+            file for file in self.init_model.download_files if file.endswith(".onnx")
+        ]
+        if not onnx_files:
+            return
+        providers = getattr(self.init_model, "providers", ort_shim.DEFAULT_PROVIDERS)
+        for file in onnx_files:
+            # NOTE: Use new options for each session, since we tweak them per session.
+            ort_shim.warm_up_session(
+                os.path.join(config.AI_MODEL_ASSETS_DIR, file),
+                providers=providers,
+                sess_options=ort_shim.plugin_session_options(
+                    getattr(self.init_model, "num_threads", 1)
+                ),
+            )
+
+    def _init_model(self):
+        """Set up the model for the current initialization time."""
+        if self.use_gfs:
+            return self._init_model_for_gfs()
+        return self._init_model_for_era5()
+
     def _init_model_for_era5(self):
         """Set up the model for running with ERA-5 initial conditions."""
         model_class = ai_models_shim.get_model_class(self.model_name)
@@ -357,8 +446,10 @@ class AIModel:
                 f"Expected processed GFS/GDAS initial conditions file not found at"
                 f" {gdas_proc_fn}."
             )
-        logger.info("Copying processed GFS/GDAS file from cache to local...")
-        shutil.copy(gdas_proc_pth, gdas_proc_fn)
+        # ai-models only ever opens the input file for reading, so we can simply link
+        # to the copy in our cache instead of duplicating it locally.
+        logger.info("Linking processed GFS/GDAS file from cache to local...")
+        _link_or_copy(gdas_proc_pth, pathlib.Path(gdas_proc_fn))
         logger.info("... done.")
         logger.info(f"Reading GFS/GDAS initial conditions from {gdas_proc_fn}.")
 
@@ -384,10 +475,73 @@ class AIModel:
             file=str(gdas_proc_fn),
         )
 
+    def _run(self) -> None:
+        from . import ort_shim
+
+        with ort_shim.patched_inference_session():
+            self.init_model.run()
+
     @modal.method()
     def run_model(self) -> None:
         logger.info("Invoking AIModel.run_model()...")
-        self.init_model.run()
+        self._run()
+
+    @modal.method()
+    def run_for(self, model_init: datetime.datetime) -> None:
+        """Run the model for another initialization time, re-using this container.
+
+        Modal ties a container to the arguments its class was constructed with, so
+        this lets us run a batch of forecasts on a single container. The ai-models
+        model is still re-built for each initialization time; only PanguWeather
+        avoids re-loading its weights, by re-using the ORT sessions we warmed up
+        when the container started. GraphCast and FourCastNet load their weights
+        inside `run()`, so for them we only save the container start-up.
+        """
+        logger.info(f"Invoking AIModel.run_for({model_init})...")
+        if model_init != self.model_init:
+            self._set_model_init(model_init)
+            logger.info(f"   Model output path: {str(self.out_pth)}")
+            self.init_model = self._init_model()
+        self._run()
+
+
+def _link_or_copy(src: pathlib.Path, dst: pathlib.Path) -> None:
+    """Make `src` available at `dst` as cheaply as possible.
+
+    We try a symlink first, then a hard link (only possible on the same device), and
+    only fall back to a full copy if neither is supported by the filesystem.
+    """
+    dst.unlink(missing_ok=True)
+    try:
+        os.symlink(src, dst)
+        return
+    except OSError as e:
+        logger.debug("Could not symlink %s -> %s: %s", src, dst, e)
+    try:
+        os.link(src, dst)
+        return
+    except OSError as e:
+        logger.debug("Could not hard link %s -> %s: %s", src, dst, e)
+    shutil.copy(src, dst)
+
+
+def _list_dir(dirname: str) -> set[str]:
+    """Names of all entries in a directory, or an empty set if it doesn't exist."""
+    try:
+        with os.scandir(dirname) as entries:
+            return {entry.name for entry in entries}
+    except FileNotFoundError:
+        return set()
+
+
+def _download_asset(url: str, asset: str) -> int:
+    """Download a single model asset, returning the number of files downloaded."""
+    from multiurl import download
+
+    os.makedirs(os.path.dirname(asset), exist_ok=True)
+    download(url, asset + ".download")
+    os.replace(asset + ".download", asset)
+    return 1
 
 
 # This routine is made available as a stand-alone function, and it's up to the user
@@ -396,8 +550,6 @@ class AIModel:
 # that it can be called a cheaper, non-GPU instance and avoid wasting cycles outside
 # of model inference on such a more expensive machine.
 def _maybe_download_assets(model_name: str) -> None:
-    from multiurl import download
-
     logger.info(f"Maybe retrieving assets for model {model_name}...")
 
     # For the requested model, retrieve the pretrained model weights and cache them to
@@ -410,22 +562,32 @@ def _maybe_download_assets(model_name: str) -> None:
     # ready to do at this stage of setup.
     model_class = ai_models_shim.get_model_class(model_name)
     n_files = len(model_class.download_files)
-    n_downloaded = 0
+    pending = []
+    # Check for existing assets with one directory listing per directory, rather than
+    # one stat() call per file; this matters on the network file system.
+    existing = {}
     for i, file in enumerate(model_class.download_files):
         asset = os.path.realpath(os.path.join(config.AI_MODEL_ASSETS_DIR, file))
-        if not os.path.exists(asset):
-            os.makedirs(os.path.dirname(asset), exist_ok=True)
+        asset_dir, asset_name = os.path.split(asset)
+        if asset_dir not in existing:
+            existing[asset_dir] = _list_dir(asset_dir)
+        if asset_name not in existing[asset_dir]:
             logger.info(f"({i}/{n_files}) downloading {asset}")
-            download(
-                model_class.download_url.format(file=file),
-                asset + ".download",
-            )
-            os.rename(asset + ".download", asset)
-            n_downloaded += 1
+            pending.append((model_class.download_url.format(file=file), asset))
+    # Each asset is a separate HTTPS download, so overlap them to hide per-file latency.
+    # NOTE: Each asset is moved into place as soon as its own download finishes, so
+    # that a container killed partway through a batch keeps the assets it completed.
+    n_downloaded = 0
+    if pending:
+        with ThreadPoolExecutor(max_workers=MAX_ASSET_DOWNLOAD_WORKERS) as executor:
+            n_downloaded = sum(executor.map(lambda p: _download_asset(*p), pending))
     if not n_downloaded:
         logger.info("   No assets need to be downloaded.")
     logger.info("... done retrieving assets.")
 
+
+def _maybe_download_gfs_template(model_name: str) -> None:
+    """Ensure the GFS/GDAS -> ERA-5 template for a model exists in our cache."""
     template_pth = config.make_gfs_template_path(model_name)
     logger.info("Checking for GFS/GDAS -> ERA-5 template at %s", template_pth)
     if not template_pth.exists():
@@ -433,10 +595,7 @@ def _maybe_download_assets(model_name: str) -> None:
         # Two options: we've saved it to a bucket (so just download it), or we need
         # to generate it from scratch.
         bucket_name = os.environ.get("GCS_BUCKET_NAME", "")
-        service_account_info = gcs.get_service_account_json("GCS_SERVICE_ACCOUNT_INFO")
-        gcs_handler = gcs.GoogleCloudStorageHandler.with_service_account_info(
-            service_account_info
-        )
+        gcs_handler = gcs.get_handler_from_env("GCS_SERVICE_ACCOUNT_INFO")
         template_fn = template_pth.name
         target_blob = gcs_handler.client.bucket(bucket_name).blob(template_fn)
 
@@ -458,6 +617,92 @@ def _maybe_download_assets(model_name: str) -> None:
         gcs_handler.download_blob(bucket_name, template_fn, template_pth)
 
 
+def _generate_forecasts(
+    model_name: str,
+    model_inits: Sequence[datetime.datetime],
+    lead_time: int,
+    use_gfs: bool,
+    upload_to_gcs: bool,
+) -> None:
+    """Generate forecasts for one or more initialization times, on one model instance."""
+    logger.info(f"Setting up model {model_name} conditions...")
+    # The GFS/GDAS initial conditions are processed against this template, so it must
+    # be available before we can kick off that processing.
+    _maybe_download_gfs_template(model_name)
+    # If necessary, download and prepare GFS initial conditions. Again, don't waste time
+    # with a GPU process for this. We spawn this in the background so that it overlaps
+    # with downloading the model assets below; the two write to disjoint paths.
+    gfs_calls = []
+    if use_gfs:
+        gfs_calls = [
+            prepare_gfs_analysis.spawn(model_name, model_init)
+            for model_init in model_inits
+        ]
+    # Pre-emptively try to download assets from our cheaper CPU-only function, so that
+    # we don't waste time on the GPU machine.
+    _maybe_download_assets(model_name)
+    for gfs_call in gfs_calls:
+        gfs_call.get()
+    # We only construct the model class once; each forecast then runs on the same
+    # (warm) container.
+    ai_model = AIModel(model_name, model_inits[0], lead_time, use_gfs)
+
+    # Upload each forecast in the background while the next one runs; a single
+    # worker is enough, since each upload is already parallelized internally.
+    with ThreadPoolExecutor(max_workers=1) as upload_pool:
+        uploads = []
+        for model_init in model_inits:
+            logger.info(f"Generating forecast for {model_init}...")
+            ai_model.run_for.remote(model_init)
+            logger.info("... forecast complete!")
+
+            # Double check that we successfully produced a model output file.
+            out_pth = config.make_output_path(model_name, model_init, use_gfs)
+            logger.info(f"Checking output file {str(out_pth)}...")
+            if out_pth.exists():
+                logger.info("   Success!")
+            else:
+                logger.info("   Did not find expected output file.")
+
+            if upload_to_gcs:
+                uploads.append(upload_pool.submit(_upload_forecast, out_pth))
+            else:
+                logger.warning("Skipping upload to Google Cloud Storage.")
+        # Surface any errors from the uploads.
+        for upload in uploads:
+            upload.result()
+
+
+def _upload_forecast(out_pth: pathlib.Path) -> None:
+    """Upload a forecast output file to Google Cloud Storage."""
+    bucket_name = os.environ.get("GCS_BUCKET_NAME", "")
+    service_account_info = os.environ.get("GCS_SERVICE_ACCOUNT_INFO", "")
+
+    if (not bucket_name) or (not service_account_info):
+        logger.warning("Not able to access to Google Cloud Storage; skipping upload.")
+        return
+
+    logger.info(f"Attempting to upload to GCS bucket gs://{bucket_name}...")
+    gcs_handler = gcs.get_handler_from_env("GCS_SERVICE_ACCOUNT_INFO")
+    dest_blob_name = out_pth.name
+    logger.info(f"Uploading to gs://{bucket_name}/{dest_blob_name}")
+    # NOTE: Large outputs are automatically uploaded as parallel chunks.
+    target_blob = gcs_handler.upload_blob(
+        bucket_name,
+        out_pth,
+        dest_blob_name,
+        content_type="application/x-grib",
+    )
+    logger.info("Checking that upload was successful...")
+    if target_blob.generation is not None:
+        logger.info("   Success!")
+    else:
+        logger.info(
+            f"   Did not find expected blob ({dest_blob_name}) in GCS bucket"
+            f" ({bucket_name})."
+        )
+
+
 @stub.function(
     image=stub.image,
     secrets=[config.ENV_SECRETS],
@@ -478,58 +723,35 @@ def generate_forecast(
     if not skip_validate_env:
         config.validate_env()
 
-    logger.info(f"Setting up model {model_name} conditions...")
-    # Pre-emptively try to download assets from our cheaper CPU-only function, so that
-    # we don't waste time on the GPU machine.
-    _maybe_download_assets(model_name)
-    # If necessary, download and prepare GFS initial conditions. Again, don't waste time
-    # with a GPU process for this.
-    if use_gfs:
-        prepare_gfs_analysis.remote(model_name, model_init)
-    ai_model = AIModel(model_name, model_init, lead_time, use_gfs)
+    _generate_forecasts(model_name, [model_init], lead_time, use_gfs, upload_to_gcs)
 
-    logger.info("Generating forecast...")
-    ai_model.run_model.remote()
-    logger.info("... forecast complete!")
 
-    # Double check that we successfully produced a model output file.
-    logger.info(f"Checking output file {str(ai_model.out_pth)}...")
-    if ai_model.out_pth.exists():
-        logger.info("   Success!")
-    else:
-        logger.info("   Did not find expected output file.")
+@stub.function(
+    image=stub.image,
+    secrets=[config.ENV_SECRETS],
+    network_file_systems={str(config.CACHE_DIR): volume},
+    allow_cross_region_volumes=True,
+    timeout=86_400,
+)
+def generate_forecasts(
+    model_name: str = "panguweather",
+    model_inits: Sequence[datetime.datetime] = (datetime.datetime(2023, 7, 1, 0, 0),),
+    lead_time: int = 12,
+    use_gfs: bool = False,
+    skip_validate_env: bool = False,
+    upload_to_gcs: bool = True
+):
+    """Generate forecasts for several initialization times using the specified model.
 
-    if upload_to_gcs: 
-        # Try to upload to Google Cloud Storage
-        bucket_name = os.environ.get("GCS_BUCKET_NAME", "")
-        service_account_info = gcs.get_service_account_json("GCS_SERVICE_ACCOUNT_INFO")
+    This is faster than calling `generate_forecast()` for each initialization time,
+    since the forecasts all run on one container; see `AIModel.run_for()` for
+    what is (and isn't) re-used between them.
+    """
 
-        if (bucket_name is None) or (not service_account_info):
-            logger.warning("Not able to access to Google Cloud Storage; skipping upload.")
-            return
+    if not skip_validate_env:
+        config.validate_env()
 
-        logger.info(f"Attempting to upload to GCS bucket gs://{bucket_name}...")
-        gcs_handler = gcs.GoogleCloudStorageHandler.with_service_account_info(
-            service_account_info
-        )
-        dest_blob_name = ai_model.out_pth.name
-        logger.info(f"Uploading to gs://{bucket_name}/{dest_blob_name}")
-        gcs_handler.upload_blob(
-            bucket_name,
-            ai_model.out_pth,
-            dest_blob_name,
-        )
-        logger.info("Checking that upload was successful...")
-        target_blob = gcs_handler.client.bucket(bucket_name).blob(dest_blob_name)
-        if target_blob.exists():
-            logger.info("   Success!")
-        else:
-            logger.info(
-                f"   Did not find expected blob ({dest_blob_name}) in GCS bucket"
-                f" ({bucket_name})."
-            )
-    else:
-        logger.warning("Skipping upload to Google Cloud Storage.")
+    _generate_forecasts(model_name, model_inits, lead_time, use_gfs, upload_to_gcs)
 
 
 @stub.function(
@@ -546,10 +768,7 @@ def make_model_era5_template(model_name: str):
     import numpy as np
 
     bucket_name = os.environ.get("GCS_BUCKET_NAME", "")
-    service_account_info = gcs.get_service_account_json("GCS_SERVICE_ACCOUNT_INFO")
-    gcs_handler = gcs.GoogleCloudStorageHandler.with_service_account_info(
-        service_account_info
-    )
+    gcs_handler = gcs.get_handler_from_env("GCS_SERVICE_ACCOUNT_INFO")
 
     model_class = ai_models_shim.get_model_class(model_name)
     model = model_class(  # noqa: F811
@@ -577,14 +796,14 @@ def make_model_era5_template(model_name: str):
             f.write(np.zeros_like(template.shape), template=template)
 
     logger.info("Uploading to gs://%s/%s", bucket_name, out_fn)
-    gcs_handler.upload_blob(
+    target_blob = gcs_handler.upload_blob(
         bucket_name,
         out_fn,
         out_fn,
+        content_type="application/x-grib",
     )
     logger.info("Checking that upload was successful...")
-    target_blob = gcs_handler.client.bucket(bucket_name).blob(out_fn)
-    if target_blob.exists():
+    if target_blob.generation is not None:
         logger.info("   Success!")
     else:
         logger.info(
@@ -603,7 +822,9 @@ def main(
     make_template: bool = False,
     run_checks: bool = False,
     run_forecast: bool = False,
-    upload_to_gcs: bool = False
+    upload_to_gcs: bool = False,
+    n_forecasts: int = 1,
+    forecast_interval: int = 6,
 ):
     """Entrypoint for triggering a remote ai-models weather forecast run.
 
@@ -620,6 +841,10 @@ def main(
             runtime environment.
         run_forecast: enable call to remote generate_forecast() for running the actual
             forecast model.
+        n_forecasts: number of consecutive forecasts to run, starting at model_init;
+            these all run on the same model instance. Defaults to 1.
+        forecast_interval: hours between the initialization times of consecutive
+            forecasts when n_forecasts > 1. Defaults to 6.
     """
     # Quick sanity checks on model arguments; if we don't need to call out to our
     # remote apps, then we shouldn't!
@@ -633,7 +858,18 @@ def main(
         make_model_era5_template.remote(model_name)
     if run_checks:
         check_assets.remote()
-    if run_forecast:
+    if run_forecast and n_forecasts > 1:
+        generate_forecasts.remote(
+            model_name=model_name,
+            model_inits=[
+                model_init + datetime.timedelta(hours=forecast_interval * i)
+                for i in range(n_forecasts)
+            ],
+            lead_time=lead_time,
+            use_gfs=use_gfs,
+            upload_to_gcs=upload_to_gcs
+        )
+    elif run_forecast:
         generate_forecast.remote(
             model_name=model_name,
             model_init=model_init,
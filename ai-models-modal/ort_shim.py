@@ -0,0 +1,518 @@
+"""Shim for tuning the ONNX Runtime sessions created by ai-models plugins.
+
+Plugins like PanguWeather construct their own `onnxruntime.InferenceSession` deep
+inside `Model.run()`, so there is no way to configure those sessions through the
+ai-models interface. Instead, we temporarily swap in our own sub-class of
+`InferenceSession` while a model runs; see `patched_inference_session()`.
+"""
+
+import contextlib
+import ctypes
+import functools
+import hashlib
+import math
+import os
+import pathlib
+import subprocess
+import uuid
+from typing import Any, Iterator, Sequence
+
+import numpy as np
+import onnxruntime as ort
+
+from . import config
+
+logger = config.get_logger(__name__)
+
+# Map from ONNX tensor type strings to the NumPy dtypes we use for device buffers.
+ONNX_TO_NUMPY_DTYPES = {
+    "tensor(float)": np.float32,
+    "tensor(float16)": np.float16,
+    "tensor(double)": np.float64,
+    "tensor(int32)": np.int32,
+    "tensor(int64)": np.int64,
+}
+
+# Execution providers that the ai-models plugins use when running on a GPU.
+DEFAULT_PROVIDERS = ("CUDAExecutionProvider", "CPUExecutionProvider")
+
+# Options for the CUDA execution provider. Most importantly, we use heuristics to
+# pick cuDNN convolution algorithms instead of the default exhaustive benchmarking,
+# which can stall the first inference for minutes.
+CUDA_PROVIDER_OPTIONS = {
+    "device_id": 0,
+    "arena_extend_strategy": "kNextPowerOfTwo",
+    "cudnn_conv_algo_search": "DEFAULT",
+    "do_copy_in_default_stream": True,
+}
+
+# Options for the TensorRT execution provider, which we only use if it's enabled via
+# `config.USE_TENSORRT`. TensorRT keys cached engines on a hash of the model, so the
+# models can all share one engine cache.
+TENSORRT_PROVIDER_OPTIONS = {
+    "device_id": 0,
+    "trt_fp16_enable": True,
+    "trt_engine_cache_enable": True,
+    "trt_engine_cache_path": str(config.ORT_CACHE_DIR / "trt_engines"),
+    "trt_max_workspace_size": 4 * 1024**3,
+}
+
+
+# Shared libraries the TensorRT provider loads at runtime (TensorRT 8, for
+# onnxruntime-gpu 1.16). onnxruntime-gpu lists the provider as available whether or
+# not these are installed, so we have to check for them ourselves.
+TENSORRT_LIBRARIES = ("libnvinfer.so.8", "libnvinfer_plugin.so.8")
+
+
+@functools.cache
+def _tensorrt_available() -> bool:
+    """Check whether the TensorRT provider can actually be used."""
+    if "TensorrtExecutionProvider" not in ort.get_available_providers():
+        return False
+    for library in TENSORRT_LIBRARIES:
+        try:
+            ctypes.CDLL(library)
+        except OSError as e:
+            logger.warning("TensorRT is enabled but can't be loaded: %s", e)
+            return False
+    return True
+
+
+def _uses_tensorrt(providers: Sequence[Any] | None) -> bool:
+    """Check whether a list of providers includes the TensorRT provider."""
+    return any(
+        provider == "TensorrtExecutionProvider"
+        or (isinstance(provider, tuple) and provider[0] == "TensorrtExecutionProvider")
+        for provider in providers or []
+    )
+
+
+def _configure_providers(providers: Sequence[Any] | None) -> list[Any] | None:
+    """Attach our default options to the CUDA execution provider, if requested.
+
+    If TensorRT is enabled and available, we also run ahead of the CUDA provider
+    with it. Options explicitly passed by the caller take precedence over ours.
+    """
+    if providers is None:
+        return None
+    configured = []
+    if (
+        config.USE_TENSORRT
+        and "CUDAExecutionProvider" in providers
+        and not _uses_tensorrt(providers)
+        and _tensorrt_available()
+    ):
+        pathlib.Path(TENSORRT_PROVIDER_OPTIONS["trt_engine_cache_path"]).mkdir(
+            parents=True, exist_ok=True
+        )
+        configured.append(
+            ("TensorrtExecutionProvider", dict(TENSORRT_PROVIDER_OPTIONS))
+        )
+    for provider in providers:
+        if provider == "CUDAExecutionProvider":
+            provider = (provider, dict(CUDA_PROVIDER_OPTIONS))
+        elif isinstance(provider, tuple) and provider[0] == "CUDAExecutionProvider":
+            provider = (provider[0], {**CUDA_PROVIDER_OPTIONS, **provider[1]})
+        configured.append(provider)
+    return configured
+
+
+# cgroup v2 file holding the CPU quota (and period) for our container.
+CGROUP_CPU_MAX_PTH = "/sys/fs/cgroup/cpu.max"
+
+
+def _cpu_allotment() -> int:
+    """Number of CPUs this container is allowed to use.
+
+    Modal limits CPU with a cgroup quota rather than a cpuset, so the affinity mask
+    still lists every CPU on the host; we use the quota when there is one.
+    """
+    n_cpus = len(os.sched_getaffinity(0))
+    try:
+        with open(CGROUP_CPU_MAX_PTH) as f:
+            quota, period = f.read().split()
+        if quota == "max":
+            return n_cpus
+        return max(1, min(n_cpus, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        return n_cpus
+
+
+def _configure_session_options(
+    sess_options: ort.SessionOptions | None,
+) -> ort.SessionOptions:
+    """Tune session options for running on a GPU."""
+    if sess_options is None:
+        sess_options = ort.SessionOptions()
+    # The CPU memory arena is of little use when the model runs on the GPU, but
+    # memory pattern planning lets ORT pre-allocate for our fixed-shape models.
+    sess_options.enable_cpu_mem_arena = False
+    sess_options.enable_mem_pattern = True
+    # Only run as many threads as the CPUs we're actually allotted - not the number
+    # on the host, which is what ORT defaults to - so that CPU fallback ops don't
+    # thrash the CPUs we need for I/O. We never raise a thread count that the plugin
+    # has already asked for. The graphs are run one node at a time, so there's no
+    # need for an inter-op thread pool.
+    n_threads = _cpu_allotment()
+    if sess_options.intra_op_num_threads > 0:
+        n_threads = min(n_threads, sess_options.intra_op_num_threads)
+    sess_options.intra_op_num_threads = n_threads
+    sess_options.inter_op_num_threads = 1
+    sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    # Reset these since the plugins may share one SessionOptions between sessions,
+    # and we may have tweaked them for a previous session; see
+    # `_use_optimized_model()`.
+    sess_options.optimized_model_filepath = ""
+    sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return sess_options
+
+
+def convert_model_to_fp16(model_pth: str | os.PathLike) -> pathlib.Path:
+    """Convert an ONNX model's weights to FP16, caching the result beside it.
+
+    Model inputs and outputs are left in FP32 so that the ai-models plugins' pre- and
+    post-processing work unchanged.
+
+    Parameters
+    ----------
+    model_pth : str or os.PathLike
+        Path to the ONNX model to convert.
+
+    Returns
+    -------
+    pathlib.Path
+        Path to the converted model, "<model>.fp16.onnx".
+    """
+    model_pth = pathlib.Path(model_pth)
+    fp16_pth = model_pth.with_suffix(".fp16.onnx")
+    if fp16_pth.exists():
+        return fp16_pth
+
+    import onnx
+    from onnxconverter_common import float16
+
+    logger.info("Converting %s to FP16", model_pth)
+    model = float16.convert_float_to_float16(onnx.load(model_pth), keep_io_types=True)
+    tmp_pth = fp16_pth.with_name(f".{fp16_pth.name}.{uuid.uuid4().hex}")
+    onnx.save(model, tmp_pth)
+    os.replace(tmp_pth, fp16_pth)
+    return fp16_pth
+
+
+@functools.cache
+def _gpu_name() -> str:
+    """Name of the GPU we're running on (e.g. "NVIDIA A100-SXM4-40GB"), if any."""
+    try:
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"],
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    names = result.stdout.strip().splitlines()
+    return names[0] if names else ""
+
+
+def _optimized_model_path(
+    model_pth: str, providers: Sequence[Any] | None
+) -> pathlib.Path:
+    """Path where we cache the ORT-optimized version of an ONNX model.
+
+    Optimized graphs are only guaranteed to work with the version of ORT that
+    produced them, and may contain optimizations specific to the execution providers
+    and hardware they were produced for. So we key the cache on all of these: the
+    ORT version goes in the file name, along with a digest of the providers and
+    the GPU type.
+    """
+    provider_names = [
+        provider[0] if isinstance(provider, tuple) else provider
+        for provider in providers or []
+    ]
+    digest = hashlib.sha1(
+        "|".join([*provider_names, _gpu_name()]).encode()
+    ).hexdigest()[:12]
+    return config.ORT_CACHE_DIR / (
+        f"{pathlib.Path(model_pth).stem}.ort-{ort.__version__}.{digest}.opt.onnx"
+    )
+
+
+def _use_optimized_model(
+    path_or_bytes: str | bytes,
+    sess_options: ort.SessionOptions,
+    providers: Sequence[Any] | None,
+) -> tuple[str | bytes, pathlib.Path | None]:
+    """Set up a session to load (or produce) a cached, pre-optimized model graph.
+
+    If we've already cached an optimized graph for this model, we load that instead
+    and skip graph optimization entirely. Otherwise, we ask ORT to save the graph it
+    optimizes to a temporary path; the caller should move it into place with
+    `_commit_optimized_model()` once the session is created.
+
+    Returns
+    -------
+    tuple[str | bytes, pathlib.Path | None]
+        The model to load, and the temporary path for the optimized graph if one
+        is being produced.
+    """
+    if not isinstance(path_or_bytes, (str, os.PathLike)):
+        return path_or_bytes, None
+
+    optimized_pth = _optimized_model_path(path_or_bytes, providers)
+    if optimized_pth.exists():
+        logger.info("Loading cached optimized model graph %s", optimized_pth)
+        sess_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        )
+        return str(optimized_pth), None
+
+    # NOTE: Write to a unique temporary path, since other containers sharing the
+    # cache may be doing the same thing at the same time.
+    optimized_pth.parent.mkdir(parents=True, exist_ok=True)
+    tmp_pth = optimized_pth.with_name(f".{optimized_pth.name}.{uuid.uuid4().hex}")
+    sess_options.optimized_model_filepath = str(tmp_pth)
+    return path_or_bytes, tmp_pth
+
+
+def _commit_optimized_model(
+    model_pth: str,
+    providers: Sequence[Any] | None,
+    tmp_pth: pathlib.Path,
+    on_gpu: bool,
+) -> None:
+    """Move a freshly optimized model graph into the cache.
+
+    If the session didn't end up on the GPU (e.g. because the CUDA provider failed
+    to initialize and ORT fell back to the CPU), the graph may contain CPU-specific
+    nodes, so we discard it rather than caching it for other containers.
+    """
+    if not tmp_pth.exists():
+        return
+    if not on_gpu:
+        logger.warning("Not caching optimized model graph for %s; not on GPU", model_pth)
+        tmp_pth.unlink(missing_ok=True)
+        return
+    os.replace(tmp_pth, _optimized_model_path(model_pth, providers))
+    logger.info("Cached optimized model graph for %s", model_pth)
+
+
+class IOBindingInferenceSession(ort.InferenceSession):
+    """An `InferenceSession` which runs through an IOBinding when on a GPU.
+
+    Input and output buffers are allocated once on the device and re-used for every
+    call to `run()`, rather than being re-allocated each time; this matters for the
+    models which call `run()` once per step in an autoregressive loop.
+    """
+
+    def __init__(
+        self,
+        path_or_bytes: str | bytes,
+        sess_options: ort.SessionOptions | None = None,
+        providers: Sequence[Any] | None = None,
+        provider_options: Sequence[dict] | None = None,
+        **kwargs,
+    ) -> None:
+        # NOTE: If the caller passes options for each provider separately, we leave
+        # their providers alone rather than trying to merge the two.
+        if provider_options is None:
+            providers = _configure_providers(providers)
+        sess_options = _configure_session_options(sess_options)
+        if config.USE_FP16_WEIGHTS and isinstance(path_or_bytes, (str, os.PathLike)):
+            path_or_bytes = str(convert_model_to_fp16(path_or_bytes))
+        if _uses_tensorrt(providers):
+            # TensorRT builds (and caches) its own optimized engines, and can't run
+            # many of the fused operators in a graph that ORT has fully optimized.
+            model, tmp_optimized_pth = path_or_bytes, None
+        else:
+            model, tmp_optimized_pth = _use_optimized_model(
+                path_or_bytes, sess_options, providers
+            )
+        super().__init__(
+            model,
+            sess_options=sess_options,
+            providers=providers,
+            provider_options=provider_options,
+            **kwargs,
+        )
+        if tmp_optimized_pth is not None:
+            _commit_optimized_model(
+                path_or_bytes, providers, tmp_optimized_pth, self._on_gpu
+            )
+        self._input_buffers: dict[str, ort.OrtValue] = {}
+        self._output_buffers: dict[str, ort.OrtValue] = {}
+
+    @property
+    def _on_gpu(self) -> bool:
+        return "CUDAExecutionProvider" in self.get_providers()
+
+    @staticmethod
+    def _make_buffer(node_arg: Any) -> ort.OrtValue | None:
+        """Allocate a device buffer for an input/output, if it has a static shape."""
+        dtype = ONNX_TO_NUMPY_DTYPES.get(node_arg.type)
+        if dtype is None or not all(isinstance(d, int) for d in node_arg.shape):
+            return None
+        return ort.OrtValue.ortvalue_from_shape_and_type(
+            node_arg.shape, dtype, "cuda", 0
+        )
+
+    def _bind_input(self, io_binding: ort.IOBinding, node_arg: Any, value: Any) -> None:
+        """Bind an input, copying it into a persistent device buffer when possible."""
+        if isinstance(value, ort.OrtValue):
+            io_binding.bind_ortvalue_input(node_arg.name, value)
+            return
+        if node_arg.name not in self._input_buffers:
+            self._input_buffers[node_arg.name] = self._make_buffer(node_arg)
+        buffer = self._input_buffers[node_arg.name]
+        value = np.asarray(value)
+        if (
+            buffer is None
+            or not hasattr(buffer, "update_inplace")
+            or value.dtype != ONNX_TO_NUMPY_DTYPES[node_arg.type]
+            or list(value.shape) != buffer.shape()
+        ):
+            io_binding.bind_cpu_input(node_arg.name, value)
+            return
+        buffer.update_inplace(np.ascontiguousarray(value))
+        io_binding.bind_ortvalue_input(node_arg.name, buffer)
+
+    def _get_output_buffer(self, output: Any) -> ort.OrtValue | None:
+        """Get a re-usable device buffer for an output, if it has a static shape."""
+        if output.name not in self._output_buffers:
+            self._output_buffers[output.name] = self._make_buffer(output)
+        return self._output_buffers[output.name]
+
+    def run(
+        self,
+        output_names: Sequence[str] | None,
+        input_feed: dict[str, Any],
+        run_options: ort.RunOptions | None = None,
+    ) -> list[np.ndarray]:
+        if not self._on_gpu:
+            return super().run(output_names, input_feed, run_options)
+
+        io_binding = self.io_binding()
+        inputs_by_name = {node_arg.name: node_arg for node_arg in self.get_inputs()}
+        for name, value in input_feed.items():
+            self._bind_input(io_binding, inputs_by_name[name], value)
+
+        outputs = self.get_outputs()
+        if output_names:
+            outputs_by_name = {output.name: output for output in outputs}
+            outputs = [outputs_by_name[name] for name in output_names]
+        for output in outputs:
+            buffer = self._get_output_buffer(output)
+            if buffer is None:
+                io_binding.bind_output(output.name, "cuda", 0)
+            else:
+                io_binding.bind_ortvalue_output(output.name, buffer)
+
+        self.run_with_iobinding(io_binding, run_options)
+        # NOTE: `OrtValue.numpy()` copies from the device, so callers are free to
+        # hold on to these arrays while we re-use the device buffers.
+        return [value.numpy() for value in io_binding.get_outputs()]
+
+
+# Sessions created ahead of time by `warm_up_session()`, keyed on the real path of
+# their model; while patched, `InferenceSession` hands these out instead of creating
+# new sessions.
+_WARM_SESSIONS: dict[str, IOBindingInferenceSession] = {}
+
+
+def plugin_session_options(num_threads: int = 1) -> ort.SessionOptions:
+    """Build the same `SessionOptions` that PanguWeather creates in `Model.run()`.
+
+    Sessions we create ahead of time are handed to the plugin in place of the ones it
+    would have created itself, so they need to honor the plugin's settings.
+
+    Parameters
+    ----------
+    num_threads : int
+        The plugin model's `num_threads` setting.
+    """
+    sess_options = ort.SessionOptions()
+    sess_options.enable_cpu_mem_arena = False
+    sess_options.enable_mem_pattern = False
+    sess_options.enable_mem_reuse = False
+    sess_options.intra_op_num_threads = num_threads
+    return sess_options
+
+
+def warm_up_session(
+    model_pth: str | os.PathLike,
+    providers: Sequence[Any] = DEFAULT_PROVIDERS,
+    sess_options: ort.SessionOptions | None = None,
+) -> None:
+    """Create a session for a model and run it once on dummy inputs.
+
+    The first run of a session on a GPU is slow, since device memory allocation and
+    cuDNN/cuBLAS initialization all happen lazily. By doing this when a container
+    starts, the model itself runs at full speed from its first step.
+
+    Parameters
+    ----------
+    model_pth : str or os.PathLike
+        Path to the ONNX model to warm up.
+    providers : Sequence
+        Execution providers to create the session with; these should match what the
+        model's plugin uses.
+    sess_options : ort.SessionOptions, optional
+        Session options to create the session with; like `providers`, these should
+        match what the model's plugin uses (see `plugin_session_options()`).
+    """
+    model_pth = os.path.realpath(model_pth)
+    if model_pth in _WARM_SESSIONS:
+        return
+    logger.info("Warming up ORT session for %s", model_pth)
+    try:
+        session = IOBindingInferenceSession(
+            model_pth, sess_options=sess_options, providers=list(providers)
+        )
+        input_feed = {}
+        for node_arg in session.get_inputs():
+            dtype = ONNX_TO_NUMPY_DTYPES.get(node_arg.type)
+            if dtype is None or not all(isinstance(d, int) for d in node_arg.shape):
+                # We can't make up inputs for this model, but we can still hand out
+                # the session we've already created.
+                input_feed = None
+                break
+            input_feed[node_arg.name] = np.zeros(node_arg.shape, dtype=dtype)
+        if input_feed is not None:
+            session.run(None, input_feed)
+    except Exception as e:
+        logger.warning("Could not warm up ORT session for %s: %s", model_pth, e)
+        return
+    _WARM_SESSIONS[model_pth] = session
+
+
+def _make_inference_session(
+    path_or_bytes: str | bytes, *args, **kwargs
+) -> IOBindingInferenceSession:
+    """Construct a tuned session, re-using a warmed-up one if we have it.
+
+    NOTE: A warmed-up session is returned regardless of the options passed here, so
+    `warm_up_session()` must be given the same options that the plugin uses.
+    """
+    if isinstance(path_or_bytes, (str, os.PathLike)):
+        session = _WARM_SESSIONS.get(os.path.realpath(path_or_bytes))
+        if session is not None:
+            logger.info("Re-using warmed-up ORT session for %s", path_or_bytes)
+            return session
+    return IOBindingInferenceSession(path_or_bytes, *args, **kwargs)
+
+
+@contextlib.contextmanager
+def patched_inference_session() -> Iterator[None]:
+    """Make `onnxruntime.InferenceSession` construct our tuned sessions.
+
+    This relies on the ai-models plugins looking up `InferenceSession` on the
+    `onnxruntime` module at call time (e.g. `ort.InferenceSession(...)`), which
+    they all do.
+    """
+    original_inference_session = ort.InferenceSession
+    ort.InferenceSession = _make_inference_session
+    try:
+        yield
+    finally:
+        ort.InferenceSession = original_inference_session